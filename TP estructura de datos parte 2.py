@@ -15,11 +15,15 @@ from __future__ import annotations
 from typing import List, Optional
 from datetime import datetime
 import itertools
+import time
 import heapq
-from collections import deque
+import re
+import sys
 
-# contador de ids
-_id_counter = itertools.count(1)
+# contador de ids (si el modulo se recarga se conserva el mismo, asi los ids
+# nuevos no chocan con los de mensajes ya creados)
+if "_id_counter" not in globals():
+    _id_counter = itertools.count(1)
 
 
 
@@ -28,14 +32,22 @@ _id_counter = itertools.count(1)
 class Mensaje:
     """mensaje simple de correo"""
 
+    # sin __dict__ por instancia (pueden haber muchisimos mensajes)
+    __slots__ = ("_id", "_remitente", "_destinatario", "_asunto", "_cuerpo",
+                 "_timestamp_ns", "_leido", "_asunto_lower", "_remitente_lower")
+
     def __init__(self, remitente: str, destinatario: str, asunto: str, cuerpo: str):
         self._id = next(_id_counter)
         self._remitente = remitente
         self._destinatario = destinatario
         self._asunto = asunto
         self._cuerpo = cuerpo
-        self._timestamp = datetime.now()
+        # entero en nanosegundos; el datetime se arma recien al pedirlo
+        self._timestamp_ns = time.time_ns()
         self._leido = False
+        # versiones en minuscula para las busquedas
+        self._asunto_lower = asunto.lower()
+        self._remitente_lower = remitente.lower()
 
     @property
     def id(self): return self._id
@@ -53,7 +65,9 @@ class Mensaje:
     def cuerpo(self): return self._cuerpo
 
     @property
-    def timestamp(self): return self._timestamp
+    def timestamp(self):
+        segundos, ns = divmod(self._timestamp_ns, 1_000_000_000)
+        return datetime.fromtimestamp(segundos).replace(microsecond=ns // 1000)
 
     @property
     def leido(self): return self._leido
@@ -68,11 +82,19 @@ class Mensaje:
 #Carpetas
 
 class Carpeta:
-    def __init__(self, nombre: str, padre: Optional["Carpeta"] = None):
+    __slots__ = ("_nombre", "_padre", "_subcarpetas", "_mensajes", "_owner")
+
+    def __init__(self, nombre: str, padre: Optional["Carpeta"] = None, owner: Optional["Usuario"] = None):
         self._nombre = nombre
         self._padre = padre
-        self._subcarpetas: List[Carpeta] = []
-        self._mensajes: List[Mensaje] = []
+        # subcarpetas por nombre (el dict conserva el orden de creacion)
+        self._subcarpetas: dict[str, Carpeta] = {}
+        # mensajes por id (orden de llegada, borrado O(1))
+        self._mensajes: dict[int, Mensaje] = {}
+        # usuario duenio del arbol (se hereda del padre si no se pasa)
+        if owner is None and padre is not None:
+            owner = padre._owner
+        self._owner = owner
 
     @property
     def nombre(self): return self._nombre
@@ -80,77 +102,118 @@ class Carpeta:
     @property
     def padre(self): return self._padre
 
+    # copias de solo lectura para uso externo; el codigo interno recorre
+    # directamente _subcarpetas y _mensajes
     @property
-    def subcarpetas(self): return list(self._subcarpetas)
+    def subcarpetas(self): return tuple(self._subcarpetas.values())
 
     @property
-    def mensajes(self): return list(self._mensajes)
+    def mensajes(self): return tuple(self._mensajes.values())
 
     def crear_subcarpeta(self, nombre: str):
+        # si ya existe una con ese nombre se devuelve la misma
+        if nombre in self._subcarpetas:
+            return self._subcarpetas[nombre]
         nueva = Carpeta(nombre, self)
-        self._subcarpetas.append(nueva)
+        self._subcarpetas[nombre] = nueva
         return nueva
 
     def agregar_mensaje(self, mensaje: Mensaje):
-        self._mensajes.append(mensaje)
+        # si la carpeta ya lo tiene no se vuelve a indexar (el dict guarda una sola copia)
+        ya_estaba = mensaje.id in self._mensajes
+        self._mensajes[mensaje.id] = mensaje
+        if self._owner is not None and not ya_estaba:
+            self._owner._indexar(mensaje, self)
+
+    def agregar_mensajes(self, mensajes):
+        """agrega varios mensajes de una (por ej. al importar una casilla)"""
+        # solo se indexan los que la carpeta no tenia (igual que agregar_mensaje)
+        nuevos = {m.id: m for m in mensajes if m.id not in self._mensajes}
+        self._mensajes.update(nuevos)
+        if self._owner is not None:
+            self._owner._indexar_lote(nuevos.values(), self)
 
     def eliminar_mensaje_por_id(self, mensaje_id: int):
-        for i, m in enumerate(self._mensajes):
-            if m.id == mensaje_id:
-                return self._mensajes.pop(i)
-        return None
+        m = self._mensajes.pop(mensaje_id, None)
+        if m is not None and self._owner is not None:
+            self._owner._desindexar(m, self)
+        return m
 
+    # los recorridos usan una pila explicita en vez de recursion
+    # (las subcarpetas se apilan al reves para mantener el orden original)
     def buscar_mensajes_por_asunto(self, texto: str):
-
         texto = texto.lower()
-        encontrados = [m for m in self._mensajes if texto in m.asunto.lower()]
-        for sub in self._subcarpetas:
-            encontrados.extend(sub.buscar_mensajes_por_asunto(texto))
+        encontrados = []
+        pila = [self]
+        while pila:
+            nodo = pila.pop()
+            encontrados.extend(m for m in nodo._mensajes.values() if texto in m._asunto_lower)
+            pila.extend(reversed(nodo._subcarpetas.values()))
         return encontrados
 
     def buscar_mensajes_por_remitente(self, remit: str):
         remit = remit.lower()
-        encontrados = [m for m in self._mensajes if remit == m.remitente.lower()]
-        for sub in self._subcarpetas:
-            encontrados.extend(sub.buscar_mensajes_por_remitente(remit))
+        encontrados = []
+        pila = [self]
+        while pila:
+            nodo = pila.pop()
+            encontrados.extend(m for m in nodo._mensajes.values() if remit == m._remitente_lower)
+            pila.extend(reversed(nodo._subcarpetas.values()))
         return encontrados
 
     def encontrar_subcarpeta_por_ruta(self, ruta: List[str]):
-        if not ruta:
-            return self
-        nombre = ruta[0]
-        for sub in self._subcarpetas:
-            if sub.nombre == nombre:
-                return sub.encontrar_subcarpeta_por_ruta(ruta[1:])
-        return None
+        nodo = self
+        for nombre in ruta:
+            nodo = nodo._subcarpetas.get(nombre)
+            if nodo is None:
+                return None
+        return nodo
 
     def mover_mensaje_a(self, mensaje_id: int, destino: "Carpeta"):
-        mensaje = self.eliminar_mensaje_por_id(mensaje_id)
-        if mensaje:
-            destino.agregar_mensaje(mensaje)
-            return True
-        for sub in self._subcarpetas:
-            if sub.mover_mensaje_a(mensaje_id, destino):
+        pila = [self]
+        while pila:
+            nodo = pila.pop()
+            mensaje = nodo.eliminar_mensaje_por_id(mensaje_id)
+            if mensaje:
+                destino.agregar_mensaje(mensaje)
                 return True
+            pila.extend(reversed(nodo._subcarpetas.values()))
         return False
 
+    def _collect(self, nivel: int, out: List[str]):
+        pila = [(self, nivel)]
+        while pila:
+            nodo, n = pila.pop()
+            out.append("  " * n + f"- {nodo._nombre} ({len(nodo._mensajes)} mensajes)")
+            sangria = "  " * (n + 1)
+            out.extend(f"{sangria}* {m}" for m in nodo._mensajes.values())
+            pila.extend((sub, n + 1) for sub in reversed(nodo._subcarpetas.values()))
+
     def listar_estructura(self, nivel=0):
-        print("  " * nivel + f"- {self._nombre} ({len(self._mensajes)} mensajes)")
-        for m in self._mensajes:
-            print("  " * (nivel + 1) + f"* {m}")
-        for sub in self._subcarpetas:
-            sub.listar_estructura(nivel + 1)
+        # se arma todo el listado y se escribe de una sola vez
+        out: List[str] = []
+        self._collect(nivel, out)
+        sys.stdout.write("\n".join(out) + "\n")
 
 
 
 # Clase de usuario
 
 class Usuario:
+    __slots__ = ("_nombre", "_email", "_msg_index", "_subject_index",
+                 "_root", "_inbox", "_sent", "_trash")
+
     def __init__(self, nombre: str, email: str):
         self._nombre = nombre
-        self._email = email
-
-        self._root = Carpeta("root")
+        # internado: es la clave con la que se busca al usuario
+        self._email = sys.intern(email)
+        # indice id de mensaje -> carpetas que lo contienen, en orden de llegada
+        # (si alguien se manda un mail a si mismo esta en inbox y en sent)
+        self._msg_index: dict[int, List[Carpeta]] = {}
+        # indice invertido: palabra del asunto -> ids de mensajes
+        self._subject_index: dict[str, set[int]] = {}
+
+        self._root = Carpeta("root", owner=self)
         self._inbox = self._root.crear_subcarpeta("inbox")
         self._sent = self._root.crear_subcarpeta("sent")
         self._trash = self._root.crear_subcarpeta("trash")
@@ -178,11 +241,96 @@ class Usuario:
             carpeta_destino = self._inbox
         carpeta_destino.agregar_mensaje(mensaje)
 
+    def recibir_mensajes(self, mensajes: List[Mensaje], carpeta_destino: Optional[Carpeta] = None):
+        if carpeta_destino is None:
+            carpeta_destino = self._inbox
+        carpeta_destino.agregar_mensajes(mensajes)
+
+    def _indexar(self, mensaje: Mensaje, carpeta: Carpeta):
+        self._indexar_lote((mensaje,), carpeta)
+
+    def _indexar_lote(self, mensajes, carpeta: Carpeta):
+        # los indices quedan en variables locales; cada id sigue necesitando
+        # su propia entrada
+        indice = self._msg_index
+        por_palabra = self._subject_index
+        for mensaje in mensajes:
+            carpetas = indice.setdefault(mensaje.id, [])
+            if carpeta in carpetas:
+                continue
+            if not carpetas:
+                for palabra in mensaje._asunto_lower.split():
+                    por_palabra.setdefault(palabra, set()).add(mensaje.id)
+            carpetas.append(carpeta)
+
+    def _desindexar(self, mensaje: Mensaje, carpeta: Carpeta):
+        carpetas = self._msg_index.get(mensaje.id)
+        if carpetas is None or carpeta not in carpetas:
+            return
+        carpetas.remove(carpeta)
+        if carpetas:
+            # queda otra copia en otra carpeta
+            return
+        del self._msg_index[mensaje.id]
+        for palabra in mensaje._asunto_lower.split():
+            ids = self._subject_index.get(palabra)
+            if ids is not None:
+                ids.discard(mensaje.id)
+                if not ids:
+                    del self._subject_index[palabra]
+
+    def buscar_mensaje_por_id(self, mensaje_id: int):
+        carpetas = self._msg_index.get(mensaje_id)
+        if not carpetas:
+            return None
+        return carpetas[0]._mensajes[mensaje_id]
+
+    def buscar_por_asunto(self, texto: str):
+        """busca en todas las carpetas usando el indice invertido (orden de llegada).
+
+        Cada palabra de la consulta tiene que ser una palabra completa del
+        asunto y el texto tiene que aparecer tal cual ("of" no encuentra
+        "oferta"; para eso esta Carpeta.buscar_mensajes_por_asunto, que busca
+        por subcadena).
+        """
+        texto = texto.lower()
+        candidatos: Optional[set[int]] = None
+        for token in texto.split():
+            ids = self._subject_index.get(token, set())
+            candidatos = set(ids) if candidatos is None else candidatos & ids
+            if not candidatos:
+                return []
+        if candidatos is None:
+            candidatos = self._msg_index.keys()
+        # filtro final por subcadena exacta sobre los pocos candidatos
+        encontrados = []
+        for i in sorted(candidatos):
+            m = self.buscar_mensaje_por_id(i)
+            if texto in m._asunto_lower:
+                encontrados.append(m)
+        return encontrados
+
     def mover_mensaje(self, mensaje_id: int, ruta_destino: List[str]):
         destino = self._root.encontrar_subcarpeta_por_ruta(ruta_destino)
         if not destino:
             return False
-        return self._root.mover_mensaje_a(mensaje_id, destino)
+        return self.mover_mensaje_a_carpeta(mensaje_id, destino)
+
+    def mover_mensaje_a_carpeta(self, mensaje_id: int, destino: Carpeta, origen: Optional[Carpeta] = None):
+        """igual que mover_mensaje pero con la carpeta destino ya resuelta.
+
+        Si no se indica `origen` se mueve la copia que llego primero.
+        """
+        if origen is None:
+            carpetas = self._msg_index.get(mensaje_id)
+            if not carpetas:
+                return False
+            origen = carpetas[0]
+        mensaje = origen.eliminar_mensaje_por_id(mensaje_id)
+        if not mensaje:
+            return False
+        destino.agregar_mensaje(mensaje)
+        return True
 
     def listar_carpetas(self):
         print(f"Carpetas de {self._email}:")
@@ -200,18 +348,42 @@ class ServidorCorreo:
         self._usuarios[usuario.email] = usuario
 
     def enviar(self, remitente: str, destinatario: str, asunto: str, cuerpo: str):
-        if remitente not in self._usuarios:
+        rem = self._usuarios.get(remitente)
+        if rem is None:
             print("Remitente no registrado")
             return None
-        if destinatario not in self._usuarios:
+        dest = self._usuarios.get(destinatario)
+        if dest is None:
             print("Destinatario no registrado")
             return None
 
         mensaje = Mensaje(remitente, destinatario, asunto, cuerpo)
-        self._usuarios[destinatario].recibir_mensaje(mensaje)
-        self._usuarios[remitente].sent.agregar_mensaje(mensaje)
+        dest.recibir_mensaje(mensaje)
+        rem.sent.agregar_mensaje(mensaje)
         return mensaje
 
+    def enviar_muchos(self, remitente: str, envios: List[tuple[str, str, str]]):
+        """envia varios (destinatario, asunto, cuerpo) del mismo remitente en lote"""
+        rem = self._usuarios.get(remitente)
+        if rem is None:
+            print("Remitente no registrado")
+            return []
+
+        enviados = []
+        por_destino: dict[str, List[Mensaje]] = {}
+        for destinatario, asunto, cuerpo in envios:
+            if destinatario not in self._usuarios:
+                print(f"Destinatario no registrado: {destinatario}")
+                continue
+            mensaje = Mensaje(remitente, destinatario, asunto, cuerpo)
+            por_destino.setdefault(destinatario, []).append(mensaje)
+            enviados.append(mensaje)
+
+        for destinatario, mensajes in por_destino.items():
+            self._usuarios[destinatario].recibir_mensajes(mensajes)
+        rem.sent.agregar_mensajes(enviados)
+        return enviados
+
     def listar_usuarios(self):
         print("Usuarios:")
         for u in self._usuarios.values():
@@ -222,23 +394,46 @@ class ServidorCorreo:
 # Clase del servidor correo avanzado
 
 class ServidorCorreoAvanzado(ServidorCorreo):
-    def __init__(self, nombre):
+    def __init__(self, nombre, red: Optional[dict[str, set[str]]] = None):
         super().__init__()
-        self._nombre = nombre
+        # internado: es la clave del servidor en el grafo
+        self._nombre = sys.intern(nombre)
         self._filtros: dict[str, str] = {}
-        self._cola_prioridad: list[tuple[int, Mensaje]] = []
-        self._conexiones: dict[str, list[str]] = {}
+        # todas las palabras clave compiladas en una sola regex
+        self._filtros_re: Optional[re.Pattern] = None
+        self._filtros_orden: dict[str, int] = {}
+        # (prioridad, orden de llegada, mensaje): el contador desempata y
+        # evita que heapq tenga que comparar dos Mensaje
+        self._cola_prioridad: list[tuple[int, int, Mensaje]] = []
+        self._urgent_seq = itertools.count()
+        # grafo de la red; si se pasa `red` se comparte con los demas servidores
+        self._conexiones: dict[str, set[str]] = {} if red is None else red
 
     # filtro
     def agregar_filtro(self, clave: str, carpeta: str):
         self._filtros[clave.lower()] = carpeta.lower()
+        self._compilar_filtros()
+
+    def _compilar_filtros(self):
+        # el lookahead encuentra coincidencias solapadas; las alternativas van
+        # en el orden en que se agregaron los filtros
+        patron = "|".join(map(re.escape, self._filtros))
+        self._filtros_re = re.compile(f"(?=({patron}))")
+        self._filtros_orden = {palabra: i for i, palabra in enumerate(self._filtros)}
 
     def aplicar_filtros(self, usuario: Usuario, mensaje: Mensaje):
-        for palabra, carpeta in self._filtros.items():
-            if palabra in mensaje.asunto.lower() or palabra in mensaje.cuerpo.lower():
+        if self._filtros_re is not None:
+            # el cuerpo no se guarda en minuscula: se baja una vez por entrega
+            texto = mensaje._asunto_lower + "\n" + mensaje._cuerpo.lower()
+            hallados = {m.group(1) for m in self._filtros_re.finditer(texto)}
+            if hallados:
+                # gana el primer filtro agregado, igual que antes
+                palabra = min(hallados, key=self._filtros_orden.__getitem__)
+                carpeta = self._filtros[palabra]
                 destino = usuario.root.encontrar_subcarpeta_por_ruta([carpeta])
                 if destino:
-                    ok = usuario.mover_mensaje(mensaje.id, [carpeta])
+                    # el filtro actua sobre la copia recien recibida en el inbox
+                    ok = usuario.mover_mensaje_a_carpeta(mensaje.id, destino, origen=usuario.inbox)
                     if ok:
                         print(f"Filtro '{palabra}' aplicado: movio a '{carpeta}'")
                     else:
@@ -250,24 +445,19 @@ class ServidorCorreoAvanzado(ServidorCorreo):
 
     # Mensajes urgentes
     def agregar_mensaje_urgente(self, mensaje: Mensaje, prioridad: int):
-        heapq.heappush(self._cola_prioridad, (prioridad, mensaje))
+        heapq.heappush(self._cola_prioridad, (prioridad, next(self._urgent_seq), mensaje))
         print(f"Mensaje urgente agregado con prioridad {prioridad}")
 
     def procesar_mensajes_urgentes(self):
         print("Procesando cola de urgentes...")
         while self._cola_prioridad:
-            prioridad, mensaje = heapq.heappop(self._cola_prioridad)
+            prioridad, _, mensaje = heapq.heappop(self._cola_prioridad)
             print(f"URGENTE (p={prioridad}): {mensaje.asunto}")
 
     # Red de servidores (grafo)
     def conectar_servidor(self, otro: "ServidorCorreoAvanzado"):
-        self._conexiones.setdefault(self._nombre, [])
-        self._conexiones.setdefault(otro._nombre, [])
-
-        if otro._nombre not in self._conexiones[self._nombre]:
-            self._conexiones[self._nombre].append(otro._nombre)
-        if self._nombre not in self._conexiones[otro._nombre]:
-            self._conexiones[otro._nombre].append(self._nombre)
+        self._conexiones.setdefault(self._nombre, set()).add(otro._nombre)
+        self._conexiones.setdefault(otro._nombre, set()).add(self._nombre)
 
         print(f"Conectado: {self._nombre} <-> {otro._nombre}")
 
@@ -275,7 +465,7 @@ class ServidorCorreoAvanzado(ServidorCorreo):
         if not self._conexiones:
             print("(sin conexiones registradas)")
         for serv, vecinos in self._conexiones.items():
-            print(f"{serv}: {vecinos}")
+            print(f"{serv}: {sorted(vecinos)}")
 
     def enviar_mensaje_red(self, origen: str, destino: str):
         if origen not in self._conexiones or destino not in self._conexiones:
@@ -283,20 +473,24 @@ class ServidorCorreoAvanzado(ServidorCorreo):
             return
 
         print(f"Iniciando BFS desde {origen} hacia {destino}")
-        visitados = set()
-        cola = deque([origen])
+        if origen == destino or destino in self._conexiones[origen]:
+            print(f"Mensaje entregado correctamente de {origen} a {destino}")
+            return
 
-        while cola:
-            actual = cola.popleft()
-            if actual == destino:
+        # BFS bidireccional: se expande siempre la frontera mas chica y
+        # se corta cuando las dos busquedas se tocan
+        frente_a, visitados_a = {origen}, {origen}
+        frente_b, visitados_b = {destino}, {destino}
+        while frente_a and frente_b:
+            if len(frente_a) > len(frente_b):
+                frente_a, frente_b = frente_b, frente_a
+                visitados_a, visitados_b = visitados_b, visitados_a
+            nuevos = {v for u in frente_a for v in self._conexiones.get(u, ())} - visitados_a
+            if not nuevos.isdisjoint(visitados_b):
                 print(f"Mensaje entregado correctamente de {origen} a {destino}")
                 return
-            if actual in visitados:
-                continue
-            visitados.add(actual)
-            for vecino in self._conexiones.get(actual, []):
-                if vecino not in visitados:
-                    cola.append(vecino)
+            visitados_a |= nuevos
+            frente_a = nuevos
 
         print("No se pudo entregar el mensaje en la red")
 
@@ -323,7 +517,9 @@ def menu():
 
 
 def iniciar_programa():
-    servidor = ServidorCorreoAvanzado("ServidorPrincipal")
+    # un solo grafo compartido por todos los servidores de la red
+    red: dict[str, set[str]] = {}
+    servidor = ServidorCorreoAvanzado("ServidorPrincipal", red=red)
     servidores_red = {"ServidorPrincipal": servidor}
 
     print("Sistema iniciado.\n")
@@ -346,9 +542,10 @@ def iniciar_programa():
             asunto = input("Asunto: ")
             cuerpo = input("Cuerpo del mensaje: ")
             mensaje = servidor.enviar(rem, dest, asunto, cuerpo)
-            if mensaje and dest in servidor._usuarios:
+            usuario_dest = servidor._usuarios.get(dest)
+            if mensaje and usuario_dest is not None:
                 print("Mensaje enviado.")
-                servidor.aplicar_filtros(servidor._usuarios[dest], mensaje)
+                servidor.aplicar_filtros(usuario_dest, mensaje)
 
         # 3. Listar usuarios
         elif opcion == "3":
@@ -383,8 +580,7 @@ def iniciar_programa():
                 print("IDs o prioridad invalidos.")
                 continue
 
-            todos = usuario.root.buscar_mensajes_por_asunto("")  # trae todos
-            encontrado = next((m for m in todos if m.id == msg_id), None)
+            encontrado = usuario.buscar_mensaje_por_id(msg_id)
             if encontrado:
                 servidor.agregar_mensaje_urgente(encontrado, prioridad)
                 print("Mensaje marcado como urgente.")
@@ -401,20 +597,17 @@ def iniciar_programa():
             nombre2 = input("Nombre del servidor B: ")
 
             if nombre1 not in servidores_red:
-                servidores_red[nombre1] = ServidorCorreoAvanzado(nombre1)
+                servidores_red[nombre1] = ServidorCorreoAvanzado(nombre1, red=red)
             if nombre2 not in servidores_red:
-                servidores_red[nombre2] = ServidorCorreoAvanzado(nombre2)
+                servidores_red[nombre2] = ServidorCorreoAvanzado(nombre2, red=red)
 
             servidores_red[nombre1].conectar_servidor(servidores_red[nombre2])
             print("Servidores conectados.")
 
-        # 9. Mostrar red (todos los servidores conocidos)
+        # 9. Mostrar red (el grafo es compartido, se muestra una vez)
         elif opcion == "9":
-            print("Mostrando conexiones de todos los servidores:")
-            if not servidores_red:
-                print("(no hay servidores)")
-            for s in servidores_red.values():
-                s.mostrar_conexiones()
+            print("Mostrando conexiones de la red:")
+            servidor.mostrar_conexiones()
 
         # 10. Enviar mensaje por la red (BFS) desde el servidor origen REAL
         elif opcion == "10":